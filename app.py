@@ -1,95 +1,504 @@
+import math
+import operator
+from typing import NamedTuple
+
+import numpy as np
 import streamlit as st
 
 # Helper function for boolean inputs (Streamlit checkboxes handle this naturally)
 def get_yes_no_input_streamlit(label):
     return st.checkbox(label)
 
-# Main Triage Logic Function - based on AIIMS ATP criteria
+# Reason strings, built once at import. The classifiers return a reasons mask over this tuple
+# (bit i, or column i for the batch version, set means REASONS[i] applies).
+REASONS = (
+    "Airway compromise (Stridor/Angioedema/Active Seizures)",
+    "Breathing compromise (Abnormal RR/SpO2, Dyspnea, Wheeze)",
+    "Circulation compromise (Abnormal HR/BP, Shock Index >1, Active Bleeding)",
+    "Altered sensorium (AVPU < Alert)",
+    "Time-sensitive/Urgent condition requiring immediate attention (including extreme temp).",
+    "Other highly urgent condition (Agitation/Poisoning/Pregnancy complication).",
+    "Vital signs slightly abnormal, warranting urgent assessment (including fever).",
+    "Semi-urgent condition requiring evaluation/admission.",
+    "No specific red or yellow criteria met. Appears non-urgent.",
+)
+
+# One patient's inputs. Field order matches VITAL_KEYS followed by FLAG_KEYS; the yes/no
+# inputs default to False so only the ones that apply need to be given.
+class PatientData(NamedTuple):
+    spo2: float
+    hr: int
+    sbp: int
+    dbp: int
+    rr: int
+    temp: float
+    pain_score: int
+    avpu: str # 'A', 'V', 'P' or 'U'
+    # Red-specific inputs
+    stridor: bool = False
+    angioedema: bool = False
+    active_seizures: bool = False
+    talking_incomplete_sentences: bool = False
+    audible_wheeze: bool = False
+    active_bleeding: bool = False
+    sudden_severe_headache: bool = False
+    history_syncope: bool = False
+    agitated_violent: bool = False
+    acute_chest_pain_lt_24hr: bool = False
+    suspected_stroke_lt_24hr: bool = False
+    acute_sob_lt_12hr: bool = False
+    acute_limb_ischemia: bool = False
+    abdominal_pain_sudden_onset: bool = False
+    acute_urinary_retention: bool = False
+    pregnant_3rd_trimester_abdominal_bleed: bool = False
+    suspected_poisoning_bite: bool = False
+    fever_immunocompromised: bool = False
+    # Yellow-specific inputs
+    vomiting_diarrhea_persistent: bool = False
+    minor_trauma_with_deformity: bool = False
+    fever_no_red_flags: bool = False
+    urinary_symptoms_moderate: bool = False
+    older_adult_minor_fall: bool = False
+    pediatric_fever_irritable: bool = False
+    chronic_condition_exacerbation: bool = False
+    # Green-specific inputs
+    minor_cut_abrasion: bool = False
+    mild_cold_symptoms: bool = False
+    medication_refill_request: bool = False
+
+# Reference Triage Logic - based on AIIMS ATP criteria
+# The app itself does not call this function: the UI and the batch path run on RED_RULES/YELLOW_RULES
+# below (classify_core() and classify_patients_vec()). This is the plain statement of the protocol
+# that test_app.py checks the rule tables against, so a criteria change must be made in both places.
 def classify_patient_aiims_atp(data):
-    reasons = []
+    # Load the vitals once; they are used by several RED and YELLOW checks below
+    spo2, hr, sbp, dbp, rr, temp, pain_score = \
+        data.spo2, data.hr, data.sbp, data.dbp, data.rr, data.temp, data.pain_score
+    reasons_mask = 0
     triage_level = "GREEN" # Default to Green, then upgrade
 
     # --- 1. CHECK FOR RED CRITERIA FIRST ---
     # Physiological Compromise
-    if data['stridor'] or data['angioedema'] or data['active_seizures']:
-        reasons.append("Airway compromise (Stridor/Angioedema/Active Seizures)")
+    if data.stridor or data.angioedema or data.active_seizures:
+        reasons_mask |= 1 << 0 # Airway compromise
         triage_level = "RED"
-        return triage_level, reasons # Exit early if RED
+        return triage_level, reasons_mask # Exit early if RED
 
-    if data['talking_incomplete_sentences'] or data['audible_wheeze'] or \
-       data['rr'] > 22 or data['rr'] < 10 or data['spo2'] < 90:
-        reasons.append("Breathing compromise (Abnormal RR/SpO2, Dyspnea, Wheeze)")
+    # Vitals first: they are the most common breathing red flag and the cheapest to test
+    if rr > 22 or rr < 10 or spo2 < 90 or \
+       data.talking_incomplete_sentences or data.audible_wheeze:
+        reasons_mask |= 1 << 1 # Breathing compromise
         triage_level = "RED"
-        return triage_level, reasons # Exit early if RED
-
-    # Handle SBP=0 for shock index calculation to prevent division by zero
-    shock_index = data['hr'] / data['sbp'] if data['sbp'] != 0 else 0
-    if data['hr'] < 50 or data['hr'] > 120 or \
-       data['sbp'] < 90 or data['sbp'] > 220 or data['dbp'] < 60 or data['dbp'] > 110 or \
-       shock_index > 1.0 or data['active_bleeding']:
-        reasons.append("Circulation compromise (Abnormal HR/BP, Shock Index >1, Active Bleeding)")
+        return triage_level, reasons_mask # Exit early if RED
+
+    # Shock index HR/SBP > 1 is tested as HR > SBP: no division, and SBP=0 needs no special
+    # case since it is already caught by SBP < 90
+    if hr < 50 or hr > 120 or sbp < 90 or sbp > 220 or dbp < 60 or dbp > 110 or \
+       data.active_bleeding or hr > sbp:
+        reasons_mask |= 1 << 2 # Circulation compromise
         triage_level = "RED"
-        return triage_level, reasons # Exit early if RED
+        return triage_level, reasons_mask # Exit early if RED
 
-    if data['avpu'] in ['V', 'P', 'U']: # AVPU is 'V' (verbal), 'P' (pain), or 'U' (unresponsive).
-        reasons.append("Altered sensorium (AVPU < Alert)")
+    if data.avpu != 'A': # AVPU is 'V' (verbal), 'P' (pain), or 'U' (unresponsive).
+        reasons_mask |= 1 << 3 # Altered sensorium
         triage_level = "RED"
-        return triage_level, reasons # Exit early if RED
+        return triage_level, reasons_mask # Exit early if RED
 
     # Time-Sensitive Conditions (simplified for direct input)
-    if data['acute_chest_pain_lt_24hr'] or data['suspected_stroke_lt_24hr'] or \
-       data['acute_sob_lt_12hr'] or data['pain_score'] > 7 or \
-       data['sudden_severe_headache'] or data['acute_limb_ischemia'] or \
-       data['history_syncope'] or data['abdominal_pain_sudden_onset'] or \
-       data['fever_immunocompromised'] or data['acute_urinary_retention'] or \
-       data['temp'] > 40.0 or data['temp'] < 35.0: # Added temperature to RED
-        reasons.append("Time-sensitive/Urgent condition requiring immediate attention (including extreme temp).")
+    if data.acute_chest_pain_lt_24hr or data.suspected_stroke_lt_24hr or \
+       data.acute_sob_lt_12hr or pain_score > 7 or \
+       data.sudden_severe_headache or data.acute_limb_ischemia or \
+       data.history_syncope or data.abdominal_pain_sudden_onset or \
+       data.fever_immunocompromised or data.acute_urinary_retention or \
+       temp > 40.0 or temp < 35.0: # Added temperature to RED
+        reasons_mask |= 1 << 4 # Time-sensitive/Urgent condition requiring immediate attention
         triage_level = "RED"
-        return triage_level, reasons # Exit early if RED
+        return triage_level, reasons_mask # Exit early if RED
 
     # Other Conditions with Increased Urgency
-    if data['agitated_violent'] or data['suspected_poisoning_bite'] or \
-       data['pregnant_3rd_trimester_abdominal_bleed']:
-        reasons.append("Other highly urgent condition (Agitation/Poisoning/Pregnancy complication).")
+    if data.agitated_violent or data.suspected_poisoning_bite or \
+       data.pregnant_3rd_trimester_abdominal_bleed:
+        reasons_mask |= 1 << 5 # Other highly urgent condition
         triage_level = "RED"
-        return triage_level, reasons # Exit early if RED
+        return triage_level, reasons_mask # Exit early if RED
 
     # --- 2. CHECK FOR YELLOW CRITERIA (If not RED) ---
     # Vitals (less critical but still warranting urgency)
-    if (data['rr'] >= 20 and data['rr'] <= 22) or \
-       (data['hr'] >= 100 and data['hr'] <= 120) or \
-       (data['sbp'] >= 180 and data['sbp'] <= 220) or \
-       (data['dbp'] >= 100 and data['dbp'] <= 110) or \
-       (data['temp'] >= 38.0 and data['temp'] <= 40.0): # Added temperature to YELLOW range
-        reasons.append("Vital signs slightly abnormal, warranting urgent assessment (including fever).")
-        triage_level = "YELLOW"
-        # Don't return yet, check other yellow conditions, but don't re-classify as RED
+    yellow_vitals = 20 <= rr <= 22 or 100 <= hr <= 120 or 180 <= sbp <= 220 or \
+       100 <= dbp <= 110 or 38.0 <= temp <= 40.0 # Added temperature to YELLOW range
 
     # Symptoms/Conditions needing urgent assessment/admission
-    if (data['pain_score'] >= 4 and data['pain_score'] <= 7) or \
-       data['vomiting_diarrhea_persistent'] or data['minor_trauma_with_deformity'] or \
-       data['fever_no_red_flags'] or data['urinary_symptoms_moderate'] or \
-       data['older_adult_minor_fall'] or data['pediatric_fever_irritable'] or \
-       data['chronic_condition_exacerbation']:
-        if triage_level == "GREEN": # Only upgrade to YELLOW if no higher priority set
-            reasons.append("Semi-urgent condition requiring evaluation/admission.")
-            triage_level = "YELLOW"
-        elif triage_level == "YELLOW" and not reasons: # If already yellow from vitals, add this reason
-            reasons.append("Semi-urgent condition requiring evaluation/admission.")
+    yellow_symptoms = 4 <= pain_score <= 7 or \
+       data.vomiting_diarrhea_persistent or data.minor_trauma_with_deformity or \
+       data.fever_no_red_flags or data.urinary_symptoms_moderate or \
+       data.older_adult_minor_fall or data.pediatric_fever_irritable or \
+       data.chronic_condition_exacerbation
 
+    if yellow_vitals or yellow_symptoms:
+        triage_level = "YELLOW"
+        if yellow_vitals:
+            reasons_mask |= 1 << 6 # Vital signs slightly abnormal
+        if yellow_symptoms:
+            reasons_mask |= 1 << 7 # Semi-urgent condition requiring evaluation/admission
 
     # --- 3. DEFAULT TO GREEN (If not RED and not YELLOW) ---
-    if not reasons: # If reasons list is still empty, no Red or Yellow criteria met
-        reasons.append("No specific red or yellow criteria met. Appears non-urgent.")
+    if not reasons_mask: # If no reason has been set yet, no Red or Yellow criteria met
+        reasons_mask |= 1 << 8 # No specific red or yellow criteria met
         triage_level = "GREEN"
-    elif triage_level == "GREEN" and not reasons: # Ensure a reason is captured for GREEN if it falls through
-        reasons.append("Minor condition with stable vitals.")
-
 
-    return triage_level, reasons
+    return triage_level, reasons_mask
+
+
+# Triage level codes returned by classify_core()
+GREEN, YELLOW, RED = 0, 1, 2
+LEVELS = ("GREEN", "YELLOW", "RED")
+
+# AVPU is passed to classify_core() as an index into this tuple (0 = Alert)
+AVPU_CODES = ('A', 'V', 'P', 'U')
+AVPU_LABELS = {'A': 'A - Alert', 'V': 'V - Verbal', 'P': 'P - Pain', 'U': 'U - Unresponsive'}
+
+# Layout of the packed vitals array used by classify_core()
+VITAL_KEYS = ('spo2', 'hr', 'sbp', 'dbp', 'rr', 'temp', 'pain_score', 'avpu')
+
+# Yes/no inputs, grouped as they are shown in the UI
+RED_FLAG_KEYS = (
+    'stridor', 'angioedema', 'active_seizures', 'talking_incomplete_sentences', 'audible_wheeze',
+    'active_bleeding', 'sudden_severe_headache', 'history_syncope', 'agitated_violent',
+    'acute_chest_pain_lt_24hr', 'suspected_stroke_lt_24hr', 'acute_sob_lt_12hr', 'acute_limb_ischemia',
+    'abdominal_pain_sudden_onset', 'acute_urinary_retention', 'pregnant_3rd_trimester_abdominal_bleed',
+    'suspected_poisoning_bite', 'fever_immunocompromised',
+)
+YELLOW_FLAG_KEYS = (
+    'vomiting_diarrhea_persistent', 'minor_trauma_with_deformity', 'fever_no_red_flags',
+    'urinary_symptoms_moderate', 'older_adult_minor_fall', 'pediatric_fever_irritable',
+    'chronic_condition_exacerbation',
+)
+GREEN_FLAG_KEYS = ('minor_cut_abrasion', 'mild_cold_symptoms', 'medication_refill_request')
+
+# Bit positions of the yes/no inputs in the packed flags word (bit i is FLAG_KEYS[i])
+FLAG_KEYS = RED_FLAG_KEYS + YELLOW_FLAG_KEYS + GREEN_FLAG_KEYS
+FLAG_BITS = {key: 1 << i for i, key in enumerate(FLAG_KEYS)}
+STRIDOR = 1 << 0
+ANGIOEDEMA = 1 << 1
+ACTIVE_SEIZURES = 1 << 2
+TALKING_INCOMPLETE_SENTENCES = 1 << 3
+AUDIBLE_WHEEZE = 1 << 4
+ACTIVE_BLEEDING = 1 << 5
+SUDDEN_SEVERE_HEADACHE = 1 << 6
+HISTORY_SYNCOPE = 1 << 7
+AGITATED_VIOLENT = 1 << 8
+ACUTE_CHEST_PAIN_LT_24HR = 1 << 9
+SUSPECTED_STROKE_LT_24HR = 1 << 10
+ACUTE_SOB_LT_12HR = 1 << 11
+ACUTE_LIMB_ISCHEMIA = 1 << 12
+ABDOMINAL_PAIN_SUDDEN_ONSET = 1 << 13
+ACUTE_URINARY_RETENTION = 1 << 14
+PREGNANT_3RD_TRIMESTER_ABDOMINAL_BLEED = 1 << 15
+SUSPECTED_POISONING_BITE = 1 << 16
+FEVER_IMMUNOCOMPROMISED = 1 << 17
+VOMITING_DIARRHEA_PERSISTENT = 1 << 18
+MINOR_TRAUMA_WITH_DEFORMITY = 1 << 19
+FEVER_NO_RED_FLAGS = 1 << 20
+URINARY_SYMPTOMS_MODERATE = 1 << 21
+OLDER_ADULT_MINOR_FALL = 1 << 22
+PEDIATRIC_FEVER_IRRITABLE = 1 << 23
+CHRONIC_CONDITION_EXACERBATION = 1 << 24
+MINOR_CUT_ABRASION = 1 << 25
+MILD_COLD_SYMPTOMS = 1 << 26
+MEDICATION_REFILL_REQUEST = 1 << 27
+
+AIRWAY_MASK = STRIDOR | ANGIOEDEMA | ACTIVE_SEIZURES
+BREATHING_MASK = TALKING_INCOMPLETE_SENTENCES | AUDIBLE_WHEEZE
+TIME_SENSITIVE_MASK = ACUTE_CHEST_PAIN_LT_24HR | SUSPECTED_STROKE_LT_24HR | ACUTE_SOB_LT_12HR | \
+    SUDDEN_SEVERE_HEADACHE | ACUTE_LIMB_ISCHEMIA | HISTORY_SYNCOPE | ABDOMINAL_PAIN_SUDDEN_ONSET | \
+    FEVER_IMMUNOCOMPROMISED | ACUTE_URINARY_RETENTION
+OTHER_URGENT_MASK = AGITATED_VIOLENT | SUSPECTED_POISONING_BITE | PREGNANT_3RD_TRIMESTER_ABDOMINAL_BLEED
+YELLOW_SYMPTOMS_MASK = VOMITING_DIARRHEA_PERSISTENT | MINOR_TRAUMA_WITH_DEFORMITY | FEVER_NO_RED_FLAGS | \
+    URINARY_SYMPTOMS_MODERATE | OLDER_ADULT_MINOR_FALL | PEDIATRIC_FEVER_IRRITABLE | \
+    CHRONIC_CONDITION_EXACERBATION
+
+# Comparison operators allowed in rule conditions, for evaluating them on NumPy arrays
+RULE_OPS = {'<': operator.lt, '>': operator.gt, '!=': operator.ne}
+
+# Rule table behind classify_core() and classify_patients_vec(), i.e. the triage logic the app runs;
+# it encodes the same criteria as classify_patient_aiims_atp() (test_app.py checks they agree). Each rule is (index into REASONS,
+# flags mask, vitals conditions) and matches if any flag in the mask is set or any condition holds.
+# A condition is (vital, op, value), where vital is a VITAL_KEYS name, value is a number or another
+# vital's name, and op 'between' takes an inclusive (lo, hi) pair. AVPU is compared as its
+# AVPU_CODES index.
+# RED rules are checked in order and only the first match is reported; all YELLOW matches are.
+RED_RULES = (
+    (0, AIRWAY_MASK, ()),
+    (1, BREATHING_MASK, (('rr', '>', 22), ('rr', '<', 10), ('spo2', '<', 90))),
+    (2, ACTIVE_BLEEDING, (('hr', '<', 50), ('hr', '>', 120), ('sbp', '<', 90), ('sbp', '>', 220),
+                          ('dbp', '<', 60), ('dbp', '>', 110),
+                          ('hr', '>', 'sbp'))), # Shock index HR/SBP > 1
+    (3, 0, (('avpu', '!=', 0),)),
+    (4, TIME_SENSITIVE_MASK, (('pain_score', '>', 7), ('temp', '>', 40.0), ('temp', '<', 35.0))),
+    (5, OTHER_URGENT_MASK, ()),
+)
+YELLOW_RULES = (
+    (6, 0, (('rr', 'between', (20, 22)), ('hr', 'between', (100, 120)), ('sbp', 'between', (180, 220)),
+            ('dbp', 'between', (100, 110)), ('temp', 'between', (38.0, 40.0)))),
+    (7, YELLOW_SYMPTOMS_MASK, (('pain_score', 'between', (4, 7)),)),
+)
+GREEN_REASON = 8
+
+# Check a rule set before build_classifier() turns it into source, so that only VITAL_KEYS names,
+# RULE_OPS/'between' operators and finite numbers ever end up in the generated code.
+# Raises ValueError naming the first bad rule.
+def check_rules(red_rules, yellow_rules, green_reason):
+    def is_number(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+    def is_reason(value):
+        return isinstance(value, int) and not isinstance(value, bool) and 0 <= value < len(REASONS)
+
+    if not is_reason(green_reason):
+        raise ValueError(f"GREEN reason {green_reason!r} is not an index into REASONS")
+    for name, rules in (("RED", red_rules), ("YELLOW", yellow_rules)):
+        if not rules:
+            raise ValueError(f"{name} rule set is empty")
+        for rule in rules:
+            if not isinstance(rule, (tuple, list)) or len(rule) != 3:
+                raise ValueError(f"{name} rule {rule!r} is not (reason, flags mask, conditions)")
+            reason, flags_mask, conditions = rule
+            if not is_reason(reason):
+                raise ValueError(f"{name} rule {rule!r}: reason is not an index into REASONS")
+            if not (isinstance(flags_mask, int) and 0 <= flags_mask < 1 << len(FLAG_KEYS)):
+                raise ValueError(f"{name} rule {rule!r}: flags mask is not a combination of FLAG_KEYS bits")
+            if not flags_mask and not conditions:
+                raise ValueError(f"{name} rule {rule!r} has no flags and no conditions")
+            for condition in conditions:
+                if not isinstance(condition, (tuple, list)) or len(condition) != 3 or \
+                   condition[0] not in VITAL_KEYS:
+                    raise ValueError(f"{name} rule {rule!r}: {condition!r} is not (vital, op, value)")
+                vital, op, value = condition
+                if op == 'between':
+                    if not (isinstance(value, (tuple, list)) and len(value) == 2 and
+                            is_number(value[0]) and is_number(value[1])):
+                        raise ValueError(f"{name} rule {rule!r}: 'between' needs a (lo, hi) pair of numbers")
+                elif op in RULE_OPS:
+                    if not (is_number(value) or value in VITAL_KEYS):
+                        raise ValueError(f"{name} rule {rule!r}: {value!r} is not a number or a vital")
+                else:
+                    raise ValueError(f"{name} rule {rule!r}: unknown operator {op!r}")
+
+# Pack a PatientData into the (vitals, flags) pair taken by classify_core()
+def pack_patient(data):
+    # Unrecognised AVPU values get a code past the end of AVPU_CODES (not Alert, so RED), as in
+    # classify_patient_aiims_atp() and classify_patients_vec()
+    avpu_code = AVPU_CODES.index(data.avpu) if data.avpu in AVPU_CODES else len(AVPU_CODES)
+    vitals = np.array([getattr(data, key) for key in VITAL_KEYS[:-1]] + [avpu_code], dtype=np.float64)
+    flags = 0
+    for i, key in enumerate(FLAG_KEYS):
+        if getattr(data, key):
+            flags |= 1 << i
+    return vitals, np.uint64(flags)
+
+# Python source for one rule's test, with the rule's constants written in as literals
+def rule_source(flags_mask, conditions):
+    terms = [f"flags & {flags_mask:#x}"] if flags_mask else []
+    for vital, op, value in conditions:
+        if op == 'between':
+            terms.append(f"{value[0]!r} <= {vital} <= {value[1]!r}")
+        else:
+            terms.append(f"{vital} {op} {value if isinstance(value, str) else repr(value)}")
+    return " or ".join(terms)
+
+# Generate the classifier for a rule set as straight-line Python, so the active rules compile
+# down to plain if statements on constants (and numba can JIT the result, see get_classifier()).
+# The function takes vitals, a float64 array laid out as VITAL_KEYS, and flags, a uint64 built from
+# FLAG_KEYS. It returns (level, reasons_mask): a level code (GREEN/YELLOW/RED) and a bitmask over REASONS.
+def build_classifier(red_rules, yellow_rules, green_reason):
+    check_rules(red_rules, yellow_rules, green_reason)
+
+    any_red_flags = 0
+    any_red_conditions = ()
+    for _, flags_mask, conditions in red_rules:
+        any_red_flags |= flags_mask
+        any_red_conditions += conditions
+
+    lines = [
+        "def classify_core(vitals, flags):",
+        f"    {', '.join(VITAL_KEYS)} = {', '.join(f'vitals[{i}]' for i in range(len(VITAL_KEYS)))}",
+        "",
+        "    # --- 1. RED criteria ---",
+        "    # One combined test first; the common non-RED case never goes through the per-rule checks",
+        f"    if {rule_source(any_red_flags, any_red_conditions)}:",
+    ]
+    for reason, flags_mask, conditions in red_rules[:-1]:
+        lines += [f"        if {rule_source(flags_mask, conditions)}:",
+                  f"            return np.int8({RED}), np.uint32({1 << reason:#x})"]
+    lines += ["        # Only the last rule is left",
+              f"        return np.int8({RED}), np.uint32({1 << red_rules[-1][0]:#x})",
+              "",
+              "    # --- 2. YELLOW criteria ---",
+              "    reasons_mask = 0"]
+    for reason, flags_mask, conditions in yellow_rules:
+        lines += [f"    if {rule_source(flags_mask, conditions)}:",
+                  f"        reasons_mask |= {1 << reason:#x}"]
+    lines += ["    if reasons_mask:",
+              f"        return np.int8({YELLOW}), np.uint32(reasons_mask)",
+              "",
+              "    # --- 3. GREEN ---",
+              f"    return np.int8({GREEN}), np.uint32({1 << green_reason:#x})"]
+
+    namespace = {'np': np}
+    exec(compile("\n".join(lines) + "\n", "<rules>", "exec"), namespace)
+    return namespace['classify_core']
+
+classify_core = build_classifier(RED_RULES, YELLOW_RULES, GREEN_REASON)
+
+# JIT-compiled classify_core(), built once per server process and reused across reruns and sessions.
+# (No cache=True: the generated function has no source file for numba's on-disk cache.)
+@st.cache_resource
+def get_classifier():
+    try:
+        import numba
+    except ImportError:  # numba is optional; the plain Python function gives the same results
+        return classify_core
+    classifier = numba.njit(classify_core)
+    # Warm-up call so the first button click doesn't pay the JIT compile cost
+    classifier(np.zeros(len(VITAL_KEYS)), np.uint64(0))
+    return classifier
+
+
+# Split a RED rule set into a combined test for a whole batch: any flag in flags_mask, any packed
+# vital below lo or above hi (per-column limits collected from the 'vital < number' and
+# 'vital > number' conditions), or any of the remaining conditions (e.g. shock index HR > SBP).
+def red_gate(red_rules):
+    flags_mask = 0
+    lo = np.full(len(VITAL_KEYS), -np.inf)
+    hi = np.full(len(VITAL_KEYS), np.inf)
+    other_conditions = ()
+    for _, rule_flags, conditions in red_rules:
+        flags_mask |= rule_flags
+        for vital, op, value in conditions:
+            i = VITAL_KEYS.index(vital)
+            if op == '<' and not isinstance(value, str):
+                lo[i] = max(lo[i], value)
+            elif op == '>' and not isinstance(value, str):
+                hi[i] = min(hi[i], value)
+            else:
+                other_conditions += ((vital, op, value),)
+    return flags_mask, lo, hi, other_conditions
+
+RED_GATE_FLAGS, RED_LO, RED_HI, RED_GATE_CONDITIONS = red_gate(RED_RULES)
+
+# Batch version of classify_patient_aiims_atp() for many patients at once (e.g. CSV upload).
+# Vitals are held as one contiguous (N, len(VITAL_KEYS)) float64 matrix, so the RED test is a single
+# comparison against RED_LO/RED_HI; the per-rule masks, needed only to pick reasons, are computed for
+# RED rows and the YELLOW rules for the remaining rows. float64, like the other classifiers: float32
+# would round values such as SpO2 89.999999 onto a threshold and under-triage them.
+# Takes a pandas DataFrame or a dict of NumPy arrays with PatientData's field names as keys (missing
+# yes/no columns and blank yes/no cells count as False, like PatientData's defaults) and
+# returns (levels, reasons_mask): an array of "RED"/"YELLOW"/"GREEN" and an (N, len(REASONS)) bool matrix.
+def classify_patients_vec(df):
+    n = len(df['spo2'])
+    vitals = np.empty((n, len(VITAL_KEYS)), dtype=np.float64)
+    for j, key in enumerate(VITAL_KEYS[:-1]):
+        vitals[:, j] = df[key]
+    # AVPU as its AVPU_CODES index; anything unrecognised (e.g. 'v' or 'Verbal') gets a code past the
+    # end, so it is treated as not Alert (RED), as in classify_patient_aiims_atp()
+    avpu_match = np.asarray(df['avpu'])[:, None] == np.asarray(AVPU_CODES)
+    vitals[:, -1] = np.where(avpu_match.any(axis=1), avpu_match.argmax(axis=1), len(AVPU_CODES))
+    flags = np.zeros(n, dtype=np.uint64)
+    for i, key in enumerate(FLAG_KEYS):
+        if key in df:
+            # Through float64 so blank cells (NaN/None, e.g. from a CSV) count as False, explicitly,
+            # instead of an invalid NaN -> uint64 cast
+            is_set = np.asarray(df[key], dtype=np.float64) > 0
+            flags |= is_set.astype(np.uint64) << np.uint64(i)
+
+    def rule_mask(vitals, flags, flags_mask, conditions):
+        mask = (flags & np.uint64(flags_mask)) != 0
+        for vital, op, value in conditions:
+            x = vitals[:, VITAL_KEYS.index(vital)]
+            if op == 'between':
+                mask |= (x >= value[0]) & (x <= value[1])
+            else:
+                y = vitals[:, VITAL_KEYS.index(value)] if isinstance(value, str) else value
+                mask |= RULE_OPS[op](x, y)
+        return mask
+
+    # --- 1. RED criteria ---
+    red_mask = ((vitals < RED_LO) | (vitals > RED_HI)).any(axis=1)
+    red_mask |= rule_mask(vitals, flags, RED_GATE_FLAGS, RED_GATE_CONDITIONS)
+    red_rows = np.flatnonzero(red_mask)
+    red_vitals, red_flags = vitals[red_rows], flags[red_rows]
+    red_masks = [rule_mask(red_vitals, red_flags, flags_mask, conditions)
+                 for _, flags_mask, conditions in RED_RULES]
+    # RED reports only the first matching rule (the single-patient function exits early)
+    first_red = np.argmax(np.stack(red_masks, axis=1), axis=1)
+
+    # --- 2. YELLOW criteria (rows that aren't RED) ---
+    rest_rows = np.flatnonzero(~red_mask)
+    rest_vitals, rest_flags = vitals[rest_rows], flags[rest_rows]
+    yellow_masks = [rule_mask(rest_vitals, rest_flags, flags_mask, conditions)
+                    for _, flags_mask, conditions in YELLOW_RULES]
+    yellow_rest = np.logical_or.reduce(yellow_masks)
+    yellow_mask = np.zeros(n, dtype=np.bool_)
+    yellow_mask[rest_rows] = yellow_rest
+
+    levels = np.select([red_mask, yellow_mask], ["RED", "YELLOW"], default="GREEN")
+
+    reasons_mask = np.zeros((n, len(REASONS)), dtype=np.bool_)
+    red_reasons = np.array([reason for reason, _, _ in RED_RULES])
+    reasons_mask[red_rows, red_reasons[first_red]] = True
+    for (reason, _, _), mask in zip(YELLOW_RULES, yellow_masks):
+        reasons_mask[rest_rows[mask], reason] = True
+    reasons_mask[rest_rows[~yellow_rest], GREEN_REASON] = True
+
+    return levels, reasons_mask
 
 
 # --- Streamlit UI ---
+# Widget labels for the yes/no inputs
+FLAG_LABELS = {
+    'stridor': 'Noisy breathing (Stridor)?',
+    'angioedema': 'Facial/throat swelling (Angioedema)?',
+    'active_seizures': 'Actively seizing?',
+    'talking_incomplete_sentences': 'Talking in incomplete sentences?',
+    'audible_wheeze': 'Audible wheeze (without stethoscope)?',
+    'active_bleeding': 'Active, significant bleeding?',
+    'sudden_severe_headache': "Sudden, severe headache ('worst of life')?",
+    'history_syncope': 'History of syncope (fainting) with current symptoms?',
+    'agitated_violent': 'Patient agitated/violent?',
+    'acute_chest_pain_lt_24hr': 'Acute chest pain (< 24 hrs duration)?',
+    'suspected_stroke_lt_24hr': 'Suspected stroke symptoms (< 24 hrs duration)?',
+    'acute_sob_lt_12hr': 'Acute Shortness of Breath (< 12 hrs duration)?',
+    'acute_limb_ischemia': 'Signs of acute limb ischemia (cold/pale limb, sudden pain)?',
+    'abdominal_pain_sudden_onset': 'Sudden onset severe abdominal pain?',
+    'acute_urinary_retention': 'Acute urinary retention (cannot pass urine)?',
+    'pregnant_3rd_trimester_abdominal_bleed': 'Pregnant (3rd trimester) with abdominal pain/vaginal bleed?',
+    'suspected_poisoning_bite': 'Suspected poisoning, snake/scorpion bite?',
+    'fever_immunocompromised': 'Fever AND immunocompromised (e.g., recent chemotherapy, severe chronic illness)?',
+    'vomiting_diarrhea_persistent': 'Persistent vomiting/diarrhea (mild dehydration, not severe)?',
+    'minor_trauma_with_deformity': 'Minor trauma with suspected deformity/fracture (stable vitals)?',
+    'fever_no_red_flags': "Fever (≥38°C) without any 'Red' flags from above?",
+    'urinary_symptoms_moderate': 'Moderate urinary symptoms (e.g., severe dysuria, no retention)?',
+    'older_adult_minor_fall': 'Older adult (>65) with minor fall, stable?',
+    'pediatric_fever_irritable': 'Pediatric patient with fever & irritability (not lethargy/seizures)?',
+    'chronic_condition_exacerbation': 'Stable exacerbation of a known chronic condition (e.g., controlled asthma flare)?',
+    'minor_cut_abrasion': 'Minor cut/abrasion (not actively bleeding)?',
+    'mild_cold_symptoms': 'Mild cold symptoms (cough, runny nose, no breathing difficulty/fever)?',
+    'medication_refill_request': 'Visit primarily for routine medication refill?',
+}
+
+# Red-flag inputs grouped by system as on the paper checklist: (subheader, widget key, flag keys)
+RED_FLAG_GROUPS = (
+    ("Airway & Breathing Critical:", "red_airway_breathing_ui",
+     ('stridor', 'angioedema', 'active_seizures', 'talking_incomplete_sentences', 'audible_wheeze')),
+    ("Circulation Critical:", "red_circulation_ui", ('active_bleeding',)),
+    ("Neurological / Systemic Critical:", "red_neuro_systemic_ui",
+     ('sudden_severe_headache', 'history_syncope', 'agitated_violent')),
+    ("Time-Sensitive Emergencies:", "red_time_sensitive_ui",
+     ('acute_chest_pain_lt_24hr', 'suspected_stroke_lt_24hr', 'acute_sob_lt_12hr', 'acute_limb_ischemia',
+      'abdominal_pain_sudden_onset', 'acute_urinary_retention', 'pregnant_3rd_trimester_abdominal_bleed',
+      'suspected_poisoning_bite', 'fever_immunocompromised')),
+)
+
 st.set_page_config(layout="wide", page_title="AIIMS ATP Triage Simulator")
 
 st.title("AIIMS Triage Protocol Simulator (Rule-Based Prototype)")
@@ -97,115 +506,55 @@ st.markdown("---")
 st.write("Enter patient information to classify their triage level according to a simplified AIIMS ATP. "
          "This is a rule-based simulation to demonstrate the logic.")
 
-# Input Form using Streamlit columns for better layout
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    st.header("1. Vital Signs")
-    spo2 = st.number_input("Oxygen Saturation (SpO2 %)", min_value=0.0, max_value=100.0, value=98.0, step=0.1)
-    hr = st.number_input("Heart Rate (bpm)", min_value=0, max_value=200, value=80)
-    sbp = st.number_input("Systolic BP (mmHg)", min_value=0, max_value=250, value=120)
-    dbp = st.number_input("Diastolic BP (mmHg)", min_value=0, max_value=150, value=80)
-    rr = st.number_input("Respiratory Rate (breaths/min)", min_value=0, max_value=40, value=16)
-    temp = st.number_input("Temperature (°C)", min_value=25.0, max_value=45.0, value=37.0)
-    avpu = st.radio("AVPU Scale (Consciousness)", ['A - Alert', 'V - Verbal', 'P - Pain', 'U - Unresponsive'], index=0)
-    pain_score = st.slider("Pain Score (0-10)", 0, 10, 0) # Used for both Red (extreme) and Yellow (moderate)
-
-with col2:
-    st.header("2. Key Red-Flag Symptoms / Conditions")
-    st.markdown("*(Any 'yes' here likely results in **RED**)*")
-
-    st.subheader("Airway & Breathing Critical:")
-    stridor = st.checkbox("Noisy breathing (Stridor)?", key="stridor_ui") # Changed key for clarity
-    angioedema = st.checkbox("Facial/throat swelling (Angioedema)?", key="angioedema_ui") # Changed key
-    active_seizures = st.checkbox("Actively seizing?", key="active_seizures_ui") # Changed key
-    talking_incomplete_sentences = st.checkbox("Talking in incomplete sentences?", key="talking_incomplete_sentences_ui") # Changed key
-    audible_wheeze = st.checkbox("Audible wheeze (without stethoscope)?", key="audible_wheeze_ui") # Changed key
-
-    st.subheader("Circulation Critical:")
-    active_bleeding = st.checkbox("Active, significant bleeding?", key="active_bleeding_ui") # Changed key
-
-    st.subheader("Neurological / Systemic Critical:")
-    sudden_severe_headache = st.checkbox("Sudden, severe headache ('worst of life')?", key="sudden_severe_headache_ui") # Changed key
-    history_syncope = st.checkbox("History of syncope (fainting) with current symptoms?", key="history_syncope_ui") # Changed key
-    agitated_violent = st.checkbox("Patient agitated/violent?", key="agitated_violent_ui") # Changed key
-
-    st.subheader("Time-Sensitive Emergencies:")
-    acute_chest_pain_lt_24hr = st.checkbox("Acute chest pain (< 24 hrs duration)?", key="acute_chest_pain_lt_24hr_ui") # Changed key
-    suspected_stroke_lt_24hr = st.checkbox("Suspected stroke symptoms (< 24 hrs duration)?", key="suspected_stroke_lt_24hr_ui") # Changed key
-    acute_sob_lt_12hr = st.checkbox("Acute Shortness of Breath (< 12 hrs duration)?", key="acute_sob_lt_12hr_ui") # Changed key
-    acute_limb_ischemia = st.checkbox("Signs of acute limb ischemia (cold/pale limb, sudden pain)?", key="acute_limb_ischemia_ui") # Changed key
-    abdominal_pain_sudden_onset = st.checkbox("Sudden onset severe abdominal pain?", key="abdominal_pain_sudden_onset_ui") # Changed key
-    acute_urinary_retention = st.checkbox("Acute urinary retention (cannot pass urine)?", key="acute_urinary_retention_ui") # Changed key
-    pregnant_3rd_trimester_abdominal_bleed = st.checkbox("Pregnant (3rd trimester) with abdominal pain/vaginal bleed?", key="pregnant_3rd_trimester_abdominal_bleed_ui") # Changed key
-    suspected_poisoning_bite = st.checkbox("Suspected poisoning, snake/scorpion bite?", key="suspected_poisoning_bite_ui") # Changed key
-    fever_immunocompromised = st.checkbox("Fever AND immunocompromised (e.g., recent chemotherapy, severe chronic illness)?", key="fever_immunocompromised_ui") # Changed key
-
-
-with col3:
-    st.header("3. Urgent (Yellow) & Non-Urgent (Green) Indicators")
-    st.markdown("*(Reviewed if not **RED**)*")
-
-    st.subheader("Yellow Indicators:")
-    vomiting_diarrhea_persistent = st.checkbox("Persistent vomiting/diarrhea (mild dehydration, not severe)?", key="vomiting_diarrhea_persistent_ui") # Changed key
-    minor_trauma_with_deformity = st.checkbox("Minor trauma with suspected deformity/fracture (stable vitals)?", key="minor_trauma_with_deformity_ui") # Changed key
-    fever_no_red_flags = st.checkbox("Fever (≥38°C) without any 'Red' flags from above?", key="fever_no_red_flags_ui") # Changed key
-    urinary_symptoms_moderate = st.checkbox("Moderate urinary symptoms (e.g., severe dysuria, no retention)?", key="urinary_symptoms_moderate_ui") # Changed key
-    older_adult_minor_fall = st.checkbox("Older adult (>65) with minor fall, stable?", key="older_adult_minor_fall_ui") # Changed key
-    pediatric_fever_irritable = st.checkbox("Pediatric patient with fever & irritability (not lethargy/seizures)?", key="pediatric_fever_irritable_ui") # Changed key
-    chronic_condition_exacerbation = st.checkbox("Stable exacerbation of a known chronic condition (e.g., controlled asthma flare)?", key="chronic_condition_exacerbation_ui") # Changed key
-
-    st.subheader("Green Indicators:")
-    minor_cut_abrasion = st.checkbox("Minor cut/abrasion (not actively bleeding)?", key="minor_cut_abrasion_ui") # Changed key
-    mild_cold_symptoms = st.checkbox("Mild cold symptoms (cough, runny nose, no breathing difficulty/fever)?", key="mild_cold_symptoms_ui") # Changed key
-    medication_refill_request = st.checkbox("Visit primarily for routine medication refill?", key="medication_refill_request_ui") # Changed key
-
-
-if st.button("Classify Triage Level"):
-    # Prepare data dictionary for classification function.
-    # IMPORTANT: The keys in this dictionary MUST match the keys accessed in classify_patient_aiims_atp()
-    patient_data = {
-        'spo2': spo2,
-        'hr': hr,
-        'sbp': sbp,
-        'dbp': dbp,
-        'rr': rr,
-        'temp': temp,
-        'avpu': avpu[0], # Extracts 'A', 'V', 'P', 'U' from 'A - Alert' string
-        'pain_score': pain_score,
-        # Red-specific inputs (use direct variable names, which align with logic function)
-        'stridor': stridor,
-        'angioedema': angioedema,
-        'active_seizures': active_seizures,
-        'talking_incomplete_sentences': talking_incomplete_sentences,
-        'audible_wheeze': audible_wheeze,
-        'active_bleeding': active_bleeding,
-        'sudden_severe_headache': sudden_severe_headache,
-        'history_syncope': history_syncope,
-        'agitated_violent': agitated_violent,
-        'acute_chest_pain_lt_24hr': acute_chest_pain_lt_24hr,
-        'suspected_stroke_lt_24hr': suspected_stroke_lt_24hr,
-        'acute_sob_lt_12hr': acute_sob_lt_12hr,
-        'acute_limb_ischemia': acute_limb_ischemia,
-        'abdominal_pain_sudden_onset': abdominal_pain_sudden_onset,
-        'acute_urinary_retention': acute_urinary_retention,
-        'pregnant_3rd_trimester_abdominal_bleed': pregnant_3rd_trimester_abdominal_bleed,
-        'suspected_poisoning_bite': suspected_poisoning_bite,
-        'fever_immunocompromised': fever_immunocompromised,
-        # Yellow & Green specific inputs (use direct variable names)
-        'vomiting_diarrhea_persistent': vomiting_diarrhea_persistent,
-        'minor_trauma_with_deformity': minor_trauma_with_deformity,
-        'fever_no_red_flags': fever_no_red_flags,
-        'urinary_symptoms_moderate': urinary_symptoms_moderate,
-        'older_adult_minor_fall': older_adult_minor_fall,
-        'pediatric_fever_irritable': pediatric_fever_irritable,
-        'chronic_condition_exacerbation': chronic_condition_exacerbation,
-        'minor_cut_abrasion': minor_cut_abrasion,
-        'mild_cold_symptoms': mild_cold_symptoms,
-        'medication_refill_request': medication_refill_request
-    }
-
-    triage_level, reasons_list = classify_patient_aiims_atp(patient_data)
+# Input Form using Streamlit columns for better layout. Inside st.form, changing an input doesn't
+# rerun the script; everything is submitted together when the button is pressed.
+with st.form("triage_form"):
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.header("1. Vital Signs")
+        spo2 = st.number_input("Oxygen Saturation (SpO2 %)", min_value=0.0, max_value=100.0, value=98.0, step=0.1)
+        hr = st.number_input("Heart Rate (bpm)", min_value=0, max_value=200, value=80)
+        sbp = st.number_input("Systolic BP (mmHg)", min_value=0, max_value=250, value=120)
+        dbp = st.number_input("Diastolic BP (mmHg)", min_value=0, max_value=150, value=80)
+        rr = st.number_input("Respiratory Rate (breaths/min)", min_value=0, max_value=40, value=16)
+        temp = st.number_input("Temperature (°C)", min_value=25.0, max_value=45.0, value=37.0)
+        avpu = st.radio("AVPU Scale (Consciousness)", AVPU_CODES, index=0, format_func=AVPU_LABELS.get) # Returns the code, e.g. 'A'
+        pain_score = st.slider("Pain Score (0-10)", 0, 10, 0) # Used for both Red (extreme) and Yellow (moderate)
+
+    with col2:
+        st.header("2. Key Red-Flag Symptoms / Conditions")
+        st.markdown("*(Any selection here likely results in **RED**)*")
+        red_flags = []
+        for subheader, key, group_keys in RED_FLAG_GROUPS:
+            st.subheader(subheader)
+            red_flags += st.multiselect("Select all that apply:", group_keys,
+                                        format_func=FLAG_LABELS.get, key=key)
+
+
+    with col3:
+        st.header("3. Urgent (Yellow) & Non-Urgent (Green) Indicators")
+        st.markdown("*(Reviewed if not **RED**)*")
+        st.subheader("Yellow Indicators:")
+        yellow_flags = st.multiselect("Select all that apply:", YELLOW_FLAG_KEYS,
+                                      format_func=FLAG_LABELS.get, key="yellow_flags_ui")
+        st.subheader("Green Indicators:")
+        green_flags = st.multiselect("Select all that apply:", GREEN_FLAG_KEYS,
+                                     format_func=FLAG_LABELS.get, key="green_flags_ui")
+
+    submitted = st.form_submit_button("Classify Triage Level")
+
+if submitted:
+    # Pack the inputs the way classify_core() takes them.
+    # IMPORTANT: The order of the vitals array MUST match VITAL_KEYS
+    vitals = np.array((spo2, hr, sbp, dbp, rr, temp, pain_score, AVPU_CODES.index(avpu)), dtype=np.float64)
+    flags = 0
+    for key in red_flags + yellow_flags + green_flags:
+        flags |= FLAG_BITS[key]
+
+    # Called directly: the classifier runs in about a microsecond, less than an st.cache_data lookup
+    level_code, reasons_mask = get_classifier()(vitals, np.uint64(flags))
+    triage_level = LEVELS[level_code]
 
     st.markdown("---")
     st.subheader("🏥 Triage Result:")
@@ -217,8 +566,9 @@ if st.button("Classify Triage Level"):
         st.success(f"**Triage Level: {triage_level} - NON-URGENT CARE**")
 
     st.markdown("#### Reasons for Classification:")
-    for reason in reasons_list:
-        st.write(f"- {reason}")
+    for i in range(len(REASONS)):
+        if reasons_mask & (1 << i):
+            st.write(f"- {REASONS[i]}")
 
 st.markdown("---")
 st.header("💡 Conceptual AI/ML Enhancements for a Real-World System")
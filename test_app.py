@@ -0,0 +1,141 @@
+# Equivalence tests: the hand-written classify_patient_aiims_atp() is the reference statement of the
+# protocol, and the rule-table driven classify_core() (plain and JIT-compiled) and
+# classify_patients_vec() must give the same level and reasons for every input.
+import itertools
+import math
+import warnings
+
+import pytest
+
+import app
+from app import AVPU_CODES, FLAG_KEYS, LEVELS, REASONS, PatientData
+
+NORMAL = dict(spo2=98.0, hr=80, sbp=120, dbp=80, rr=16, temp=37.0, pain_score=0, avpu='A')
+
+# Values on and either side of every RED/YELLOW threshold
+BOUNDARIES = {
+    'spo2': (0.0, 89.0, 89.9, 90.0, 100.0),
+    'hr': (0, 49, 50, 99, 100, 120, 121, 200),
+    'sbp': (0, 89, 90, 179, 180, 220, 221),
+    'dbp': (59, 60, 99, 100, 110, 111),
+    'rr': (0, 9, 10, 19, 20, 22, 23, 40),
+    'temp': (34.9, 35.0, 37.9, 38.0, 40.0, 40.01, 45.0),
+    'pain_score': (0, 3, 4, 7, 8, 10),
+}
+
+
+def boundary_patients():
+    # Each vital on its own, and every pair of vitals (to exercise which RED reason wins)
+    for key, values in BOUNDARIES.items():
+        for value in values:
+            yield PatientData(**dict(NORMAL, **{key: value}))
+    for (key1, values1), (key2, values2) in itertools.combinations(BOUNDARIES.items(), 2):
+        for value1, value2 in itertools.product(values1, values2):
+            yield PatientData(**dict(NORMAL, **{key1: value1, key2: value2}))
+    # Shock index HR/SBP around 1
+    for hr, sbp in ((100, 100), (101, 100), (100, 101), (110, 95)):
+        yield PatientData(**dict(NORMAL, hr=hr, sbp=sbp))
+    for avpu in AVPU_CODES:
+        yield PatientData(**dict(NORMAL, avpu=avpu))
+    # Each flag on its own and combined with every single-vital boundary
+    for key in FLAG_KEYS:
+        yield PatientData(**dict(NORMAL, **{key: True}))
+        for vital, values in BOUNDARIES.items():
+            for value in values:
+                yield PatientData(**dict(NORMAL, **{key: True, vital: value}))
+
+
+PATIENTS = list(boundary_patients())
+
+
+def reasons(reasons_mask):
+    return [i for i in range(len(REASONS)) if reasons_mask & (1 << i)]
+
+
+def reference(patient):
+    level, reasons_mask = app.classify_patient_aiims_atp(patient)
+    return level, reasons(reasons_mask)
+
+
+def test_classify_core_matches_reference():
+    for patient in PATIENTS:
+        level, reasons_mask = app.classify_core(*app.pack_patient(patient))
+        assert (LEVELS[level], reasons(reasons_mask)) == reference(patient), patient
+
+
+def test_compiled_classifier_matches_reference():
+    classifier = app.get_classifier()
+    for patient in PATIENTS:
+        level, reasons_mask = classifier(*app.pack_patient(patient))
+        assert (LEVELS[level], reasons(reasons_mask)) == reference(patient), patient
+
+
+def test_classify_patients_vec_matches_reference():
+    columns = {key: [getattr(patient, key) for patient in PATIENTS] for key in PatientData._fields}
+    levels, reasons_mask = app.classify_patients_vec(columns)
+    for i, patient in enumerate(PATIENTS):
+        assert (levels[i], list(reasons_mask[i].nonzero()[0])) == reference(patient), patient
+
+
+def test_classify_patients_vec_keeps_full_precision_near_thresholds():
+    patients = [PatientData(**dict(NORMAL, **change)) for change in
+                ({'spo2': 89.999999}, {'temp': 40.000001}, {'temp': 34.9999999}, {'temp': 37.9999999})]
+    columns = {key: [getattr(patient, key) for patient in patients] for key in PatientData._fields}
+    levels, _ = app.classify_patients_vec(columns)
+    assert list(levels) == ['RED', 'RED', 'RED', 'GREEN']
+    assert list(levels) == [reference(patient)[0] for patient in patients]
+
+
+def test_unrecognised_avpu_is_red():
+    values = ['v', 'Verbal', 'X', '']
+    patients = [PatientData(**dict(NORMAL, avpu=value)) for value in values]
+    for patient in patients:
+        assert reference(patient) == ('RED', [3])
+        level, reasons_mask = app.classify_core(*app.pack_patient(patient))
+        assert (LEVELS[level], reasons(reasons_mask)) == ('RED', [3])
+        level, reasons_mask = app.get_classifier()(*app.pack_patient(patient))
+        assert (LEVELS[level], reasons(reasons_mask)) == ('RED', [3])
+    columns = {key: [getattr(patient, key) for patient in patients] for key in PatientData._fields}
+    levels, reasons_mask = app.classify_patients_vec(columns)
+    assert list(levels) == ['RED'] * len(values)
+    assert reasons_mask[:, 3].all()
+
+
+def test_classify_patients_vec_missing_flag_columns_are_false():
+    patients = [PatientData(**dict(NORMAL, spo2=spo2)) for spo2 in (85.0, 92.0, 98.0)]
+    patients[1] = patients[1]._replace(acute_chest_pain_lt_24hr=True)
+    # vitals plus a single yes/no column; the other flags default to False as in PatientData
+    columns = {key: [getattr(patient, key) for patient in patients]
+               for key in list(NORMAL) + ['acute_chest_pain_lt_24hr']}
+    levels, reasons_mask = app.classify_patients_vec(columns)
+    for i, patient in enumerate(patients):
+        assert (levels[i], list(reasons_mask[i].nonzero()[0])) == reference(patient), patient
+
+
+def test_classify_patients_vec_blank_flag_cells_are_false():
+    patients = [PatientData(**NORMAL), PatientData(**NORMAL)._replace(stridor=True), PatientData(**NORMAL)]
+    columns = {key: [getattr(patient, key) for patient in patients] for key in PatientData._fields}
+    columns['stridor'] = [math.nan, True, None]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')  # no invalid-cast RuntimeWarning
+        levels, reasons_mask = app.classify_patients_vec(columns)
+    for i, patient in enumerate(patients):
+        assert (levels[i], list(reasons_mask[i].nonzero()[0])) == reference(patient), patient
+
+
+def test_build_classifier_rejects_bad_rules():
+    bad_rule_sets = [
+        ((), app.YELLOW_RULES),                                         # empty RED rule set
+        (app.RED_RULES, ()),                                            # empty YELLOW rule set
+        (app.RED_RULES + ((5, 0, ()),), app.YELLOW_RULES),              # rule that matches nothing
+        (((1, 0, (('rr', '>=', 22),)),), app.YELLOW_RULES),             # unknown operator
+        (((1, 0, (('rr', '>', 'rr or True'),)),), app.YELLOW_RULES),    # value that isn't a vital
+        (((1, 0, (('os', '>', 1),)),), app.YELLOW_RULES),               # unknown vital
+        (((1, 0, (('rr', '>', float('inf')),)),), app.YELLOW_RULES),    # non-finite threshold
+        (((1, 0, (('rr', 'between', (20,)),)),), app.YELLOW_RULES),     # incomplete range
+        (((len(REASONS), 0, (('rr', '>', 22),)),), app.YELLOW_RULES),  # reason out of range
+        (((1, 1 << len(FLAG_KEYS), ()),), app.YELLOW_RULES),            # flag bit out of range
+    ]
+    for red_rules, yellow_rules in bad_rule_sets:
+        with pytest.raises(ValueError):
+            app.build_classifier(red_rules, yellow_rules, app.GREEN_REASON)